@@ -9,19 +9,32 @@ For SQL queries used, set the logging library level to DEBUG.
 """
 
 import contextlib
+import functools
+import itertools
+import os
+import queue
 import sqlite3
 import logging
 import threading
 import traceback
-import time
+import urllib.parse
+import weakref
 
 # For converters/adapters
 import datetime
 import json
 import uuid
 
+# orjson is optional, but parses json column values considerably faster (and straight from bytes)
+try:
+	import orjson
+except ImportError:
+	orjson = None
 
-__all__ = ['SH', 'DBTable', 'DBCol', 'DBColUnique', 'DBColROWID']
+
+__all__ = ['SH', 'SHPool', 'DBTable', 'DBCol', 'DBColUnique', 'DBColROWID', 'in_clause']
+
+_log = logging.getLogger(__name__)
 
 # Serialized permits full sharing of connections and cursors between threads
 sqlite3.threadsafety = 3
@@ -34,26 +47,38 @@ class DBTable:
 	Pass an number of DBCol objects to the constructor to add columns.
 	"""
 
+	__slots__ = ('_dbname', '_cols', '_sql', '_pkey', '_cols_by_name')
+
 	def __init__(self, dbname, *cols):
 		self._dbname = dbname
 		self._cols = cols
 
+		# Primary key column (if any) and columns by name for quick lookups
+		self._pkey = next((_ for _ in cols if isinstance(_, DBColROWID)), None)
+		self._cols_by_name = {_.DBName: _ for _ in cols}
+
+		# Columns don't change after construction, so format the SQL once
+		self._sql = "CREATE TABLE `%s` (%s)" % (dbname, ",".join([_.SQL for _ in cols]))
+
 	@property
 	def DBName(self): return self._dbname
 
 	@property
 	def Cols(self): return self._cols
 
+	@property
+	def PKey(self): return self._pkey
+
+	@property
+	def ColsByName(self): return self._cols_by_name
+
 	@property
 	def SQL(self):
 		"""
 		Returns the SQL neede to generate this table.
 		"""
 
-		cols = [_.SQL for _ in self.Cols]
-
-		cols = ",".join(cols)
-		return "CREATE TABLE `%s` (%s)" % (self.DBName, cols)
+		return self._sql
 
 class DBCol:
 	"""
@@ -62,11 +87,16 @@ class DBCol:
 	The sqlite type is passed as a string to @typ (eg, "text", "integer").
 	"""
 
+	__slots__ = ('_dbname', '_typ', '_unique', '_sql')
+
 	def __init__(self, dbname, typ):
 		self._dbname = dbname
 		self._typ = typ
 		self._unique = False
 
+		# TODO: add something for handling the unique foreign key constraint
+		self._sql = "`%s` %s" % (dbname, typ)
+
 	@property
 	def DBName(self): return self._dbname
 
@@ -82,8 +112,7 @@ class DBCol:
 		Returns the SQL used in CREATE TABLE for this column.
 		"""
 
-		# TODO: add something for handling the unique foreign key constraint
-		return "`%s` %s" % (self.DBName, self.Typ)
+		return self._sql
 
 class DBColUnique(DBCol):
 	"""
@@ -92,6 +121,8 @@ class DBColUnique(DBCol):
 	The sqlite type is passed as a string to @typ (eg, "text", "integer").
 	"""
 
+	__slots__ = ()
+
 	def __init__(self, name, typ):
 		super().__init__(name, typ)
 		self._unique = True
@@ -102,17 +133,14 @@ class DBColROWID(DBCol):
 	Inclusion of this in the DBTable constructor without providing an alternate name has implications in sqlite.
 	As there is always a primary key, explicit inclusion means the rowid is returned in SELECT * queries.
 	"""
+
+	__slots__ = ()
+
 	def __init__(self, name='rowid'):
 		super().__init__(name, 'integer')
-	
-	@property
-	def SQL(self):
-		"""
-		Returns the SQL used in CREATE TABLE for this column.
-		Defining the primary key requires an extra couple keywords in the CREATE TABLE statement.
-		"""
 
-		return super().SQL + " primary key"
+		# Defining the primary key requires an extra couple keywords in the CREATE TABLE statement.
+		self._sql += " primary key"
 
 
 class SH_sub:
@@ -120,7 +148,8 @@ class SH_sub:
 	Utility sub class for SH that permits object like access to SH classes to select tables.
 	Can subclass this and provide the class object to the SH constructor to provide an alternate template for these objects.
 	"""
-	_dbname = None
+
+	__slots__ = ('db', '_schema', '_dbname', '_execute', '_select', '_select_one', '_insert', '_update', '_delete', '_num_rows', '_getby', '_compiled_inserts', '_insert_cols', '_insert_row_sql')
 
 	@property
 	def DBName(self): return self._dbname
@@ -138,78 +167,78 @@ class SH_sub:
 		self._delete = dlt
 		self._num_rows = num
 
-		# Find primary key column
-		pkey = None
-		for col in schema.Cols:
-			if isinstance(col, DBColROWID):
-				pkey = col
-
-		# Only create these functions if there's a primary key (what would they return otherwise?)
-		if pkey is not None:
-			# This is for non-unique columns since it can return multiple results
-			def rowidorempty(res):
-				if res is None:
-					return []
-				else:
-					return [_['rowid'] for _ in res]
-
-			# This is for unique columns since it should return only one result
-			def rowidornone(res):
-				if res is None:
-					return None
-				else:
-					return res['rowid']
+		# Insert functions specialized per column tuple, see insert()
+		# Only used if inserting goes to SH.insert, as an overridden insert() must still be called
+		if getattr(ins, '__func__', None) is SH.insert:
+			self._compiled_inserts = {}
+		else:
+			self._compiled_inserts = None
 
-			# This is for unique columns since it should return only one result
-			def dictornone(res):
-				if res is None:
-					return None
-				else:
-					return dict(res)
-
-			# Have to do this for the late binding in python
-			# This is for non-unique columns
-			def getbycolumn(self, k):
-				def _(v):
-					return rowidorempty(self.select('rowid', '`%s`=?' % k, [v]))
-				return _
-
-			# This is for unique columns
-			def getbycolumnunique(self, k):
-				def _(v):
-					return rowidornone(self.select_one('rowid', '`%s`=?' % k, [v]))
-				return _
-
-			# This is for GetById
-			def getbypkey(self, k):
-				def _(v):
-					return dictornone(self.select_one('*', '`%s`=?' % k, [v]))
-				return _
+		# Columns in schema order for insert_row(), a rowid column is assigned by sqlite
+		self._insert_cols = tuple(col.DBName for col in schema.Cols if not isinstance(col, DBColROWID))
+		self._insert_row_sql = _sql_for_insert(self._dbname, self._insert_cols)
 
+		# GetBy* functions are looked up by __getattr__ from this dictionary keyed by the name after "GetBy"
+		# Each entry is the function and the SQL it runs, built once here rather than on every call
+		# Only create these functions if there's a primary key (what would they return otherwise?)
+		self._getby = {}
+		if schema.PKey is not None:
 			# Create GetBy* function for each column
-			# If you don't want this function then delete in the sub-class constructor of SH
-			# after invoking super().__init__
+			# If you don't want this function then delete it from _getby in the sub-class constructor of SH
+			# after invoking super().__init__ (eg, del self.employee._getby['name'])
 			for col in schema.Cols:
 				# Special GetById for the primary key
 				if isinstance(col, DBColROWID):
-					setattr(self, 'GetById', getbypkey(self, 'rowid'))
+					self._getby['Id'] = (SH_sub._getbypkey, _sql_for_select(self._dbname, '*', '`rowid`=?', None))
 				else:
 					# Shouldn't have much trouble with function name requirements of python and column
 					# name requirements in sqlite.
 					# TODO: Could get in trouble though since they don't exactly match up
-					fname = 'GetBy' + col.DBName
+					sql = _sql_for_select(self._dbname, ('rowid',), '`%s`=?' % col.DBName, None)
 					if col.IsUnique:
-						setattr(self, fname, getbycolumnunique(self, col.DBName))
+						self._getby[col.DBName] = (SH_sub._getbycolumnunique, sql)
 					else:
-						setattr(self, fname, getbycolumn(self, col.DBName))
+						self._getby[col.DBName] = (SH_sub._getbycolumn, sql)
+
+	def __getattr__(self, name):
+		# Only called if normal lookup fails, so this only handles the GetBy* functions
+		if name.startswith('GetBy'):
+			try:
+				fn,sql = self._getby[name[5:]]
+			except KeyError:
+				pass
+			else:
+				return functools.partial(fn, self, sql)
+
+		raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+	# This is for non-unique columns since it can return multiple results
+	def _getbycolumn(self, sql, v):
+		res = self.db._run(self._dbname, 'select', sql, (v,))
+		if res is None:
+			return []
+		else:
+			return [_['rowid'] for _ in res]
+
+	# This is for unique columns since it should return only one result
+	def _getbycolumnunique(self, sql, v):
+		res = self.db._run(self._dbname, 'select', sql, (v,)).fetchone()
+		if res is None:
+			return None
+		else:
+			return res['rowid']
+
+	# This is for GetById
+	def _getbypkey(self, sql, v):
+		res = self.db._run(self._dbname, 'select', sql, (v,)).fetchone()
+		if res is None:
+			return None
+		else:
+			return dict(res)
 
 	def HasDBColumnName(self, k):
 		"""Checks if tables has a column named @k"""
-		for col in self._schema.Cols:
-			if col.DBName == k:
-				return True
-
-		return False
+		return k in self._schema.ColsByName
 
 	def GetDBColumnNames(self):
 		"""Returns a list of strings of the column names"""
@@ -222,11 +251,56 @@ class SH_sub:
 	def select(self, cols, where=None, vals=None, order=None):
 		return self._select(self.DBName, cols, where, vals, order)
 
+	def select_iter(self, cols, where=None, vals=None, order=None, raw=False):
+		return self.db.select_iter(self.DBName, cols, where, vals, order, raw)
+
+	def select_scalars(self, col, where=None, vals=None, order=None):
+		return self.db.select_scalars(self.DBName, col, where, vals, order)
+
 	def select_one(self, cols, where=None, vals=None, order=None):
 		return self._select_one(self.DBName, cols, where, vals, order)
 
 	def insert(self, **cols):
-		return self._insert(self.DBName, **cols)
+		if self._compiled_inserts is None:
+			return self._insert(self.DBName, **cols)
+
+		k = tuple(cols)
+		try:
+			fn = self._compiled_inserts[k]
+		except KeyError:
+			fn = self._compiled_inserts[k] = self._compile_insert(k)
+		return fn(tuple(cols.values()))
+
+	def _compile_insert(self, colnames):
+		"""
+		Returns a function that does what SH.insert() does for columns @colnames with the SQL built once.
+		A closure is used rather than exec() of generated source as it's just as fast to call and values are already a tuple.
+		"""
+
+		db = self.db
+		tname = self.DBName
+		sql = _sql_for_insert(tname, colnames)
+
+		def _ins(vals):
+			if not db.InTransaction():
+				raise Exception("Attempting to insert not in a transaction")
+			return db._run(tname, 'insert', sql, vals).lastrowid
+
+		return _ins
+
+	def insert_row(self, *values):
+		"""
+		Insert a row by passing a value for every column in schema order (excluding a DBColROWID column).
+		Avoids building the kwargs dictionary of insert(), which is handy for bulk loading.
+		"""
+
+		if not self.db.InTransaction():
+			raise Exception("Attempting to insert not in a transaction")
+
+		return self.db._run(self._dbname, 'insert', self._insert_row_sql, values).lastrowid
+
+	def insert_many(self, colnames, rows):
+		return self.db.insert_many(self.DBName, colnames, rows)
 
 	def update(self, where, vals):
 		return self._update(self.DBName, where, vals)
@@ -234,9 +308,353 @@ class SH_sub:
 	def delete(self, where):
 		return self._delete(self.DBName, where)
 
+	def update_expr(self, set_clause, where=None, vals=None):
+		return self.db.update_expr(self.DBName, set_clause, where, vals)
+
+	def update_in(self, col, values, vals):
+		return self.db.update_in(self.DBName, col, values, vals)
+
+	def delete_in(self, col, values):
+		return self.db.delete_in(self.DBName, col, values)
+
 	def num_rows(self, where=None, vals=None):
 		return self._num_rows(self.DBName, where, vals)
 
+	def has_any(self, where=None, vals=None):
+		return self.db.has_any(self.DBName, where, vals)
+
+
+def _dtadapter(dt):
+	# Always include microseconds so every value has the same textual form
+	return dt.isoformat(sep=' ', timespec='microseconds')
+
+def _dtconverter(txt):
+	txt = txt.decode('ascii').strip()
+	try:
+		return datetime.datetime.fromisoformat(txt)
+	except ValueError:
+		# Older versions stored the UTC offset as " +0000", which fromisoformat() only accepts as of python 3.11
+		try:
+			return datetime.datetime.strptime(txt, "%Y-%m-%d %H:%M:%S.%f %z")
+		except ValueError:
+			return datetime.datetime.strptime(txt, "%Y-%m-%d %H:%M:%S.%f")
+
+
+def _orjsonconverter(txt):
+	try:
+		return orjson.loads(txt)
+	except orjson.JSONDecodeError:
+		# orjson is stricter than json (eg, NaN and integers over 64 bits) so let json have a go too
+		return json.loads(txt)
+
+
+def _register_converters():
+	"""
+	Register the adapters & converters for the column types handled by this library.
+	sqlite3 keeps these module-wide, so this is done once at import rather than per SH instance.
+	Types that already have a converter registered (eg, by the application) are left alone.
+	"""
+
+	# Get converters and register one for datetime.datetime & json
+	cons = [_.lower() for _ in sqlite3.converters]
+
+	# datetime objects are stored pretty much in full as ASCII strings
+	if 'datetime' not in cons:
+		sqlite3.register_adapter(datetime.datetime, _dtadapter)
+		sqlite3.register_converter("datetime", _dtconverter)
+
+	# As strings representing JSON are still just str() objects, no adapter can be defined
+	# Functions are registered directly where possible, as every wrapper is another python call per value
+	if 'json' not in cons:
+		if orjson is None:
+			sqlite3.register_converter("json", json.loads)
+		else:
+			sqlite3.register_converter("json", _orjsonconverter)
+
+	# uuid objects are stored as strings
+	if 'uuid' not in cons:
+		_UUID = uuid.UUID
+		sqlite3.register_adapter(uuid.UUID, str)
+		sqlite3.register_converter("uuid", lambda txt: _UUID(txt.decode('ascii')))
+
+	# bool is stored as 0/1 in sqlite, so just provide the type conversion
+	if 'bool' not in cons:
+		sqlite3.register_adapter(bool, int)
+		sqlite3.register_converter("bool", lambda x: bool(int(x)))
+
+_register_converters()
+
+
+def _apply_pragmas(conn, fname, defaults, pragmas, skip=()):
+	"""Issue the PRAGMAs of @defaults updated with @pragmas on @conn, skipping those named in @skip or with a value of None."""
+
+	p = dict(defaults)
+	if pragmas:
+		p.update(pragmas)
+
+	# WAL is not meaningful for an in-memory database
+	if fname == ':memory:':
+		p.pop('journal_mode', None)
+
+	for k,v in p.items():
+		if v is None or k in skip: continue
+
+		sql = "PRAGMA %s=%s" % (k,v)
+		_log.debug("SH: SQL: %s", sql)
+		conn.execute(sql)
+
+
+# SQL formatting for the select/insert/update/delete helpers of SH.
+# The same handful of statements are generated over and over again, so cache the formatted SQL keyed
+# on the table and column names (all arguments have to be hashable, hence tuples).
+
+def _joiner_sql(joiner):
+	if joiner.strip().lower() == 'and':
+		return " AND "
+	elif joiner.strip().lower() == 'or':
+		return " OR "
+	else:
+		raise ValueError("joiner parameter must be AND or OR")
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_select(tname, cols, where, order):
+	"""SELECT statement for @cols, a tuple of column names or "*" for all columns."""
+
+	if cols != '*':
+		# Comma separate list of names
+		cols = ','.join( ["`%s`"%_ for _ in cols] )
+
+	# Start formatting of sql string
+	sql = "SELECT %s FROM `%s`" % (cols, tname)
+
+	if where:
+		sql += " WHERE %s" % where
+	if order:
+		sql += " ORDER BY %s" % order
+
+	return sql
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_num_rows(tname, where):
+	"""SELECT statement counting the rows matching @where (or all rows)."""
+
+	sql = "SELECT count(*) as `count` FROM `%s`" % tname
+
+	if where:
+		sql += " WHERE %s" % where
+
+	return sql
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_has_any(tname, where):
+	"""SELECT statement that stops at the first row matching @where (or any row)."""
+
+	sql = "SELECT 1 FROM `%s`" % tname
+
+	if where:
+		sql += " WHERE %s" % where
+
+	return sql + " LIMIT 1"
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_insert(tname, colnames):
+	"""INSERT statement with ? parameters for each of the tuple @colnames."""
+
+	vnames = ",".join( ["?"]*len(colnames) )
+
+	# Format column names
+	cols = ",".join( ["`%s`" % _ for _ in colnames] )
+
+	return "INSERT INTO `%s` (%s) VALUES (%s)" % (tname,cols,vnames)
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_update(tname, set_cols, where_cols, joiner='AND'):
+	"""UPDATE statement with ? parameters for the SET columns @set_cols and the WHERE columns @where_cols."""
+
+	w = _joiner_sql(joiner).join( ['`%s`=?' % _ for _ in where_cols] )
+	s = ",".join( ['`%s`=?' % _ for _ in set_cols] )
+
+	return "UPDATE `%s` SET %s WHERE %s" % (tname, s, w)
+
+# Number of ? parameters used for the IN (...) lists of delete_in() and update_in()
+# Stays under sqlite's historical default SQLITE_MAX_VARIABLE_NUMBER of 999
+_MAX_IN_VARS = 900
+
+@functools.lru_cache(maxsize=128)
+def in_clause(col, n):
+	"""
+	Returns a WHERE clause matching column @col against @n ? parameters (eg, "`rowid` IN (?,?,?)").
+	Use this instead of formatting values into the SQL so the text is the same for a given number of values,
+	which lets sqlite3 reuse its prepared statement:
+		db.employee.select('*', in_clause('rowid', len(ids)), ids)
+	"""
+
+	return "`%s` IN (%s)" % (col, ",".join( ["?"]*n ))
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_update_expr(tname, set_clause, where):
+	sql = "UPDATE `%s` SET %s" % (tname, set_clause)
+
+	if where:
+		sql += " WHERE %s" % where
+
+	return sql
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_update_in(tname, set_cols, col, n):
+	"""UPDATE statement with ? parameters for the SET columns @set_cols and @n values of @col in the WHERE clause."""
+
+	s = ",".join( ['`%s`=?' % _ for _ in set_cols] )
+
+	return "UPDATE `%s` SET %s WHERE %s" % (tname, s, in_clause(col, n))
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_delete_in(tname, col, n):
+	"""DELETE statement with @n ? parameters for values of @col in the WHERE clause."""
+
+	return "DELETE FROM `%s` WHERE %s" % (tname, in_clause(col, n))
+
+@functools.lru_cache(maxsize=512)
+def _sql_for_delete(tname, where_cols, joiner='AND'):
+	"""DELETE statement with ? parameters for the WHERE columns @where_cols."""
+
+	w = _joiner_sql(joiner).join( ['`%s`=?' % _ for _ in where_cols] )
+
+	return "DELETE FROM `%s` WHERE %s" % (tname, w)
+
+
+class _ConnState:
+	"""
+	Connection state of an SH: the connection, what insert/update/delete statements are executed on, and the transaction flag.
+	"""
+
+	def __init__(self):
+		self.db = None
+		# A long-lived cursor when the connection belongs to one thread, otherwise the connection itself (see SH._connect)
+		self.cursor = None
+		self.in_txn = False
+
+		# SH._gen when db was opened, close() increments SH._gen so older connections aren't used again
+		self.gen = 0
+
+		# _ConnCloser of db for thread local connections
+		self.closer = None
+
+class _ThreadConnState(_ConnState, threading.local):
+	"""
+	Connection state with separate values for each thread (see SH thread_local).
+	"""
+	pass
+
+class _ReaderCursor:
+	"""
+	Cursor of a select run on one of the read-only connections of SH (see SH readers).
+	The connection stays checked out of the pool until the rows are exhausted or the cursor is closed (or garbage collected),
+	as an unfinished statement holds its read snapshot and later selects on that connection would see the same old data.
+	Otherwise behaves as the sqlite3.Cursor it wraps (eg, fetching past the end keeps returning None or []).
+	"""
+
+	__slots__ = ('_sh', '_pool', '_db', '_cur')
+
+	def __init__(self, sh, pool, db, cur):
+		self._sh = sh
+		self._pool = pool
+		self._db = db
+		self._cur = cur
+
+	def _release(self, close=False):
+		"""
+		Return the connection to the pool.
+		Once the rows are exhausted sqlite has already finished the statement, so the cursor is left usable (@close False).
+		Otherwise the cursor is closed to end the statement (and its snapshot) before the connection is handed out again.
+		"""
+
+		if self._db is None:
+			return
+
+		db = self._db
+		self._db = None
+
+		# After SH.close() the connection is already closed and not returned to the pool
+		if self._sh._read_pool is self._pool:
+			if close:
+				self._cur.close()
+			self._pool.put(db)
+
+	def __del__(self):
+		self._release(close=True)
+
+	def __iter__(self):
+		# Rows come straight from the cursor without a python call per row, iter(callable, None) calls
+		# _release() once after the last row (it returns None, which ends the iteration)
+		return itertools.chain(self._cur, iter(self._release, None))
+
+	def __next__(self):
+		try:
+			return next(self._cur)
+		except StopIteration:
+			self._release()
+			raise
+
+	def fetchone(self):
+		row = self._cur.fetchone()
+		if row is None:
+			self._release()
+		return row
+
+	def fetchmany(self, size=None):
+		if size is None:
+			size = self._cur.arraysize
+		rows = self._cur.fetchmany(size)
+		if len(rows) < size:
+			self._release()
+		return rows
+
+	def fetchall(self):
+		rows = self._cur.fetchall()
+		self._release()
+		return rows
+
+	def close(self):
+		if self._db is None:
+			self._cur.close()
+		else:
+			self._release(close=True)
+
+	@property
+	def row_factory(self): return self._cur.row_factory
+
+	@row_factory.setter
+	def row_factory(self, v): self._cur.row_factory = v
+
+	@property
+	def arraysize(self): return self._cur.arraysize
+
+	@arraysize.setter
+	def arraysize(self, v): self._cur.arraysize = v
+
+	def __getattr__(self, name):
+		# Everything else (description, rowcount, etc) is taken from the cursor
+		return getattr(self._cur, name)
+
+class _ConnCloser:
+	"""
+	Closes a thread local connection when garbage collected.
+	It's only referenced by the _ThreadConnState values of its thread, which python drops as soon as the thread finishes
+	(rather than when the threading.Thread object is garbage collected), or when replaced by the next connection of the thread.
+	"""
+
+	__slots__ = ('_conns', '_db')
+
+	def __init__(self, conns, db):
+		self._conns = conns
+		self._db = db
+
+	def __del__(self):
+		self._conns.discard(self._db)
+		self._db.close()
+
+
 class SH:
 	"""
 	Sqlite3 helper class.
@@ -245,51 +663,87 @@ class SH:
 
 	_objects = None
 
-	def __init__(self, fname, sub_constructor=SH_sub):
+	# PRAGMA statements issued by open() on each new connection
+	# Override in a subclass or pass pragmas to open() to change them; a value of None skips that PRAGMA
+	__pragmas__ = {
+		'journal_mode': 'WAL',
+		'synchronous': 'NORMAL',
+		'temp_store': 'MEMORY',
+		'cache_size': '-65536',
+		'mmap_size': '268435456',
+		# Milliseconds sqlite waits on a locked database before raising "database is locked"
+		'busy_timeout': '5000',
+	}
+
+	def __init__(self, fname, sub_constructor=SH_sub, native_types=False, validate=True, cached_statements=256, pragmas=None, thread_local=False, readers=0):
+		"""
+		@fname is the database file name (or ":memory:")
+		@sub_constructor is the SH_sub class used for the per-table objects
+		@native_types skips the converters on fetched rows so values are returned as stored by sqlite
+			(datetime & uuid as str, bool as int, json as str); convert them as needed with to_datetime(), to_uuid(), to_bool(), and to_json()
+		@validate checks the types of arguments (eg, select() columns); pass False to skip the checks on hot paths
+		@cached_statements is the number of prepared statements sqlite3 keeps per connection, keyed by SQL text
+		@pragmas is a dictionary of PRAGMA names and values merged over __pragmas__ for every open() (see open())
+		@thread_local gives each thread its own connection (opened on first use in that thread and closed when it finishes) and its own transaction
+			Otherwise all threads share one connection and one transaction.
+		@readers is the number of read-only connections that select statements outside of a transaction are spread over
+			(eg, max(4, os.cpu_count())); 0 runs them on the main connection. Best used with WAL mode (the default).
+		"""
+
 		self._fname = fname
-		self._db = None
 		self._sub_cls = sub_constructor
 		self._rowfact = None
+		self._pragmas = None
+		self._native_types = native_types
+		self._validate = validate
+		self._cached_statements = cached_statements
+		self._default_pragmas = pragmas
+		self._thread_local = thread_local
+
+		# Serializes insert/update/delete statements on the connection when it's shared by threads
+		# Thread local connections each have their own and sqlite locks the database between them (see busy_timeout)
+		if thread_local:
+			self._write_lock = None
+		else:
+			self._write_lock = threading.Lock()
 
-		# Get converters and register one for datetime.datetime & json
-		cons = [_.lower() for _ in sqlite3.converters]
-
-		# datetime objects are stored pretty much in full as ASCII strings
-		if 'datetime' not in cons:
-			def dtconverter(txt):
-				txt = txt.strip()
-				try:
-					return datetime.datetime.strptime(txt.decode('ascii'), "%Y-%m-%d %H:%M:%S.%f %z")
-				except:
-					return datetime.datetime.strptime(txt.decode('ascii'), "%Y-%m-%d %H:%M:%S.%f")
-
-			sqlite3.register_adapter(datetime.datetime, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S.%f %z"))
-			sqlite3.register_converter("datetime", dtconverter)
-
-		# As strings representing JSON are still just str() objects, no adapter can be defined
-		if 'json' not in cons:
-			sqlite3.register_converter("json", lambda txt: json.loads(txt))
+		# Connection and transaction state, see _ConnState
+		if thread_local:
+			if fname == ':memory:':
+				raise ValueError("Cannot use thread local connections to an in-memory database, each connection would get its own database")
+			self._state = _ThreadConnState()
+		else:
+			self._state = _ConnState()
 
-		# uuid objects are stored as strings
-		if 'uuid' not in cons:
-			sqlite3.register_adapter(uuid.UUID, lambda u: str(u))
-			sqlite3.register_converter("uuid", lambda txt: uuid.UUID(txt.decode('ascii')))
+		# Set by open() and cleared by close()
+		self._opened = False
+		self._gen = 0
 
-		# bool is stored as 0/1 in sqlite, so just provide the type conversion
-		if 'bool' not in cons:
-			sqlite3.register_adapter(bool, lambda x: int(x))
-			sqlite3.register_converter("bool", lambda x: bool(int(x)))
+		# All connections opened (one per thread if thread local, plus the readers)
+		self._conns = set()
 
-		# No transaction to start
-		self._cursor = None
+		# Pool of read-only connections, created in open()
+		if readers and fname == ':memory:':
+			raise ValueError("Cannot use reader connections to an in-memory database, each connection would get its own database")
+		self._readers = readers
+		self._read_pool = None
 
 		# Generate the SH_sub objects
 		self._objects = []
+
+		# (table name, create table sql) for SH_sub classes in __schema__, as built by GenerateSchema()
+		self._built_schema = {}
 		self.GenerateSchema()
 
 		for o in self._objects:
 			o.setup(self)
 
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+
+		# Scan the MRO once per class for the attribute names that tables can't be assigned to
+		cls._reserved = frozenset(dir(cls))
+
 	def GenerateSchema(self):
 		# For exach DBTable, add an object to this object that wraps the table name to reduce parameter bloat when using this library
 		# Ie: db.employee.select("*") is the same as db.select("employee", "*")
@@ -300,24 +754,33 @@ class SH:
 		# TODO: Check for duplicate DBCol.DBName within a table
 		# TODO: Check that there's only, at most, one DBColROWID
 		finalschema = []
+
+		# Names taken by the class (see __init_subclass__) or already set on this instance
+		reserved = type(self)._reserved
+		attrs = self.__dict__
+
 		for o in self.__schema__:
 			if isinstance(o, type):
 				subo = o(self, None, self.execute, self.select, self.select_one, self.insert, self.update, self.delete, self.num_rows)
-				setattr(self, subo.DBName, subo)
-				finalschema.append( subo.BuildSchema() )
+				attrs[subo.DBName] = subo
+
+				tbl = subo.BuildSchema()
+				finalschema.append(tbl)
+				self._built_schema[o] = (subo.DBName, tbl.SQL)
 
-			elif hasattr(self, o.DBName):
+			elif o.DBName in reserved or o.DBName in attrs:
 				# Prefix with db_ is table name is already chosen (eg, select, insert)
-				if hasattr(self, 'db_' + o.DBName):
+				name = 'db_' + o.DBName
+				if name in reserved or name in attrs:
 					raise Exception("Object has both %s and db_%s, cannot assign SH_sub object" % (o.DBName, o.DBName))
 				else:
 					subo = SH_sub(self, o, self.execute, self.select, self.select_one, self.insert, self.update, self.delete, self.num_rows)
-					setattr(self, 'db_' + o.DBName, subo)
+					attrs[name] = subo
 					finalschema.append(o)
 
 			else:
 				subo = self._sub_cls(self, o, self.execute, self.select, self.select_one, self.insert, self.update, self.delete, self.num_rows)
-				setattr(self, o.DBName, subo)
+				attrs[o.DBName] = subo
 				finalschema.append(o)
 
 			self._objects.append(subo)
@@ -325,11 +788,52 @@ class SH:
 		#self.__schema__.clear()
 		#self.__schema__ += finalschema
 
+	@staticmethod
+	def to_datetime(v):
+		"""Convert a datetime column value fetched with native_types to a datetime.datetime object."""
+		if v is None:
+			return None
+		if isinstance(v, str):
+			v = v.encode('ascii')
+		return _dtconverter(v)
+
+	@staticmethod
+	def to_json(v):
+		"""Convert a json column value fetched with native_types to python objects."""
+		if v is None:
+			return None
+		if orjson is not None:
+			return _orjsonconverter(v)
+		return json.loads(v)
+
+	@staticmethod
+	def to_uuid(v):
+		"""Convert a uuid column value fetched with native_types to a uuid.UUID object."""
+		if v is None:
+			return None
+		return uuid.UUID(v)
+
+	@staticmethod
+	def to_bool(v):
+		"""Convert a bool column value fetched with native_types to a bool."""
+		if v is None:
+			return None
+		return bool(int(v))
+
 	@property
 	def Filename(self): return self._fname
 
 	@property
-	def DB(self): return self._db
+	def DB(self):
+		st = self._state
+		if st.db is None or st.gen != self._gen:
+			if not self._opened:
+				return None
+
+			# Thread local connections are opened on first use in each thread
+			self._connect()
+
+		return st.db
 
 	@property
 	def Tables(self):
@@ -338,30 +842,121 @@ class SH:
 
 	def reopen(self):
 		#self.close()
-		self._db = None
-		self.open(self._rowfact)
+		self._conns.discard(self._state.db)
+		self._state.db = None
+		self._state.cursor = None
+		self.open(self._rowfact, self._pragmas)
 
-	def open(self, rowfactory=None):
+	def open(self, rowfactory=None, pragmas=None):
 		"""
 		Opens the database connection.
 		Can provide ":memory:" to use sqlite's ability to use a database in memory (or anything else it accepts).
 		Can override this function to call MakeDatabaseSchema if file doesn't exist.
+
+		@pragmas is a dictionary of PRAGMA names and values that are merged over __pragmas__ and those passed to SH() (eg, {'synchronous': 'FULL'}).
+		A value of None disables that PRAGMA, and passing an empty dictionary keeps the defaults.
 		"""
 
 		# Store in case reopen() is called
 		self._rowfact = rowfactory
+		self._pragmas = pragmas
 
-		if self.DB:
+		if self._state.db is not None and self._state.gen == self._gen:
 			raise Exception("Already opened to database '%s'" % self.Filename)
 
-		# Open database
-		self._db = sqlite3.connect(self.Filename, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level="DEFERRED")
+		self._opened = True
+		self._connect()
+
+		if self._readers and self._read_pool is None:
+			self._connect_readers()
+
+	def _connect(self):
+		"""
+		Open the connection (for the calling thread if thread local) using the settings given to open().
+		"""
+
+		db = self._new_connection(self.Filename)
+
+		st = self._state
+		st.db = db
+		if self._thread_local:
+			# Only this thread uses the connection, so one cursor can be reused for every insert/update/delete
+			st.cursor = db.cursor()
+		else:
+			# A cursor can't be used by two threads at once (sqlite3 raises or crashes), so threads sharing the
+			# connection execute on it directly and each statement gets its own cursor
+			st.cursor = db
+		st.gen = self._gen
+
+		self._conns.add(db)
+		if self._thread_local:
+			# Close this thread's connection when the thread finishes
+			# Replacing the closer of a previous connection of this thread (eg, reopen()) closes that one
+			st.closer = _ConnCloser(self._conns, db)
+
+		self._apply_pragmas(db, self._pragmas)
+
+	def _connect_readers(self):
+		"""
+		Open the pool of read-only connections used by select statements outside of a transaction.
+		"""
+
+		uri = "file:%s?mode=ro" % urllib.parse.quote(os.path.abspath(self.Filename))
+
+		self._read_pool = queue.SimpleQueue()
+		for i in range(self._readers):
+			db = self._new_connection(uri, uri=True)
+
+			# Journal mode is persistent and set by the writer (and cannot be changed from a read-only connection)
+			self._apply_pragmas(db, self._pragmas, skip=('journal_mode',))
+			db.execute("PRAGMA query_only=1")
+
+			self._conns.add(db)
+			self._read_pool.put(db)
+
+	def _new_connection(self, fname, uri=False):
+		# Open database (no converters are run on fetched values for native types)
+		if self._native_types:
+			detect = 0
+		else:
+			detect = sqlite3.PARSE_DECLTYPES
+		db = sqlite3.connect(fname, detect_types=detect, check_same_thread=False, isolation_level="DEFERRED", cached_statements=self._cached_statements, uri=uri)
 
 		# Change row factory (default is an indexable row by column name)
-		if rowfactory:
-			self.DB.row_factory = rowfactory
+		if self._rowfact:
+			db.row_factory = self._rowfact
 		else:
-			self.DB.row_factory = sqlite3.Row
+			db.row_factory = sqlite3.Row
+
+		return db
+
+	def _execute_reader(self, sql, vals):
+		"""
+		Execute the select @sql on a read-only connection checked out from the pool until the returned cursor is finished with.
+		If all of them are checked out (eg, nested loops over selects) the main connection is used rather than waiting,
+		as the cursors holding them may belong to this thread.
+		"""
+
+		pool = self._read_pool
+		try:
+			db = pool.get_nowait()
+		except queue.Empty:
+			return self.DB.execute(sql, vals)
+
+		try:
+			cur = db.execute(sql, vals)
+		except:
+			pool.put(db)
+			raise
+
+		return _ReaderCursor(self, pool, db, cur)
+
+	def _apply_pragmas(self, db, pragmas, skip=()):
+		defaults = dict(self.__pragmas__)
+		if self._default_pragmas:
+			defaults.update(self._default_pragmas)
+
+		_apply_pragmas(db, self.Filename, defaults, pragmas, skip)
 
 	def close(self):
 		"""
@@ -371,8 +966,17 @@ class SH:
 		if not self.DB:
 			raise Exception("Not opened to database '%s', cannot close it" % self.Filename)
 
-		self.DB.close()
-		self._db = None
+		# Connections of other threads are closed too and not used again
+		self._opened = False
+		self._gen += 1
+
+		for db in list(self._conns):
+			db.close()
+		self._conns.clear()
+		self._read_pool = None
+
+		self._state.db = None
+		self._state.cursor = None
 
 	def MakeDatabaseSchema(self):
 		"""
@@ -382,20 +986,32 @@ class SH:
 		ret = self.execute(None, 'schema', "select name from sqlite_master where type='table'")
 		tnames = [_['name'] for _ in ret]
 
+		# Formatting checks all schema entries before anything is executed
 		sql = self.FormatDatabaseSchema()
-		for dbname,row in sql:
-				# Table already exists, skip it
-			if dbname in tnames: continue
 
-			self.begin()
-			self.execute(None, 'schema', row)
-			self.commit()
+		# Table already exists, skip it
+		rows = [row for dbname,row in sql if dbname not in tnames]
+		if not rows:
+			return
+
+		if self.InTransaction():
+			raise Exception("Cannot make schema while in a transaction")
 
+		# Create all tables in one transaction submitted as a single script
+		script = "BEGIN;\n" + ";\n".join(rows) + ";\nCOMMIT;"
+		_log.debug("SH: SQL: %s", script)
+
+		try:
+			self.DB.executescript(script)
+		except:
+			if self.DB.in_transaction:
+				self.DB.rollback()
+			raise
 
 	def FormatDatabaseSchema(self):
 		"""Generate SQL as (table name, create table sql) 2-tuples as a list"""
 
-		logging.debug("SH: Making schema")
+		_log.debug("SH: Making schema")
 
 		ret = []
 
@@ -406,25 +1022,30 @@ class SH:
 			if isinstance(o, DBTable):
 				ret.append( (o.DBName, o.SQL) )
 			elif isinstance(o, type) and issubclass(o, SH_sub):
-				subo = o(self, None, self.execute, self.select, self.select_one, self.insert, self.update, self.delete, self.num_rows)
-				sql = subo.BuildSchema().SQL
-				ret.append( (subo.DBName, sql) )
+				# Reuse the table already built by GenerateSchema() rather than building it again
+				if o in self._built_schema:
+					ret.append( self._built_schema[o] )
+				else:
+					subo = o(self, None, self.execute, self.select, self.select_one, self.insert, self.update, self.delete, self.num_rows)
+					sql = subo.BuildSchema().SQL
+					ret.append( (subo.DBName, sql) )
 			else:
 				raise TypeError("Unrecognized schema type '%s'" % type(o))
 
 		return ret
 
 	def InTransaction(self):
-		return self._cursor is not None
+		return self._state.in_txn
 
 	def begin(self):
 		"""
 		Begin a transaction.
 		"""
 
-		if self._cursor is None:
-			logging.debug("SH: BEGIN (thread %s)" % threading.current_thread().name)
-			self._cursor = self._db.cursor()
+		if not self._state.in_txn:
+			if _log.isEnabledFor(logging.DEBUG):
+				_log.debug("SH: BEGIN (thread %s)", threading.current_thread().name)
+			self._state.in_txn = True
 		else:
 			raise Exception("Already in a transaction")
 
@@ -433,66 +1054,48 @@ class SH:
 		Commit a transaction.
 		"""
 
-		if self._cursor is None:
+		if not self._state.in_txn:
 			raise Exception("Cannot commit, no begin() issued")
 		else:
-			logging.debug("SH: COMMIT (thread %s)" % threading.current_thread().name)
-
-			# Try up to 10 times if locked (probably from another process)
-			cnt = 0
-			while cnt < 10:
-				if self.DB is None:
-					logging.info("Reopen database")
-					self.reopen()
-				try:
-					self._cursor.connection.commit()
-					self._cursor = None
-					return
-				except sqlite3.OperationalError as e:
-					if 'database is locked' in e.args[0]:
-						logging.error("Locked database in COMMIT count %d (thread %s)" % (cnt, threading.current_thread().name))
-
-						time.sleep(cnt)
-						cnt += 1
-						continue
-					else:
-						# Some other error
-						print("Some other database error")
-						traceback.print_exc()
-						raise
+			if _log.isEnabledFor(logging.DEBUG):
+				_log.debug("SH: COMMIT (thread %s)", threading.current_thread().name)
+
+			if self.DB is None:
+				_log.info("Reopen database")
+				self.reopen()
+
+			# A locked database (probably from another process) is waited on by sqlite per busy_timeout
+			try:
+				self.DB.commit()
+				self._state.in_txn = False
+			except sqlite3.OperationalError:
+				print("Database error")
+				traceback.print_exc()
+				raise
 
 	def rollback(self):
 		"""
 		Rollback a transaction.
 		"""
 
-		if self._cursor is None:
+		if not self._state.in_txn:
 			raise Exception("Cannot rollback, no begin() issued")
 		else:
-			logging.debug("SH: ROLLBACK (thread %s)" % threading.current_thread().name)
-
-			# Try up to 10 times if locked (probably from another process)
-			cnt = 0
-			while cnt < 10:
-				if self.DB is None:
-					logging.info("Reopen database")
-					self.reopen()
-				try:
-					self._cursor.connection.rollback()
-					self._cursor = None
-					return
-				except sqlite3.OperationalError as e:
-					if 'database is locked' in e.args[0]:
-						logging.error("Locked database in ROLLBACK count %d (thread %s)" % (cnt, threading.current_thread().name))
-
-						time.sleep(cnt)
-						cnt += 1
-						continue
-					else:
-						# Some other error
-						print("Some other database error")
-						traceback.print_exc()
-						raise
+			if _log.isEnabledFor(logging.DEBUG):
+				_log.debug("SH: ROLLBACK (thread %s)", threading.current_thread().name)
+
+			if self.DB is None:
+				_log.info("Reopen database")
+				self.reopen()
+
+			# A locked database (probably from another process) is waited on by sqlite per busy_timeout
+			try:
+				self.DB.rollback()
+				self._state.in_txn = False
+			except sqlite3.OperationalError:
+				print("Database error")
+				traceback.print_exc()
+				raise
 
 
 
@@ -502,34 +1105,94 @@ class SH:
 		"""
 
 		if vals is None:
-			logging.debug("SH: SQL: %s ()" % (sql,))
 			vals = tuple()
-		else:
-			logging.debug("SH: SQL: %s %s" % (sql, vals))
+
+		# Checking the level first avoids formatting the values when not debugging
+		if _log.isEnabledFor(logging.DEBUG):
+			_log.debug("SH: SQL: %s %s", sql, vals)
 
 		return self._execute(tname, cmd, sql, vals)
 
-	def _execute(self, tname, cmd, sql, vals):
-		# Try up to 10 times if locked (probably from another process)
-		cnt = 0
-		while cnt < 10:
-			if self.DB is None:
-				logging.info("Reopen database")
-				self.reopen()
-			try:
-				return self.DB.execute(sql, vals)
-			except sqlite3.OperationalError as e:
-				if 'database is locked' in e.args[0]:
-					logging.error("Locked database count %d (thread %s)" % (cnt, threading.current_thread().name))
-
-					time.sleep(cnt)
-					cnt += 1
-					continue
-				else:
-					# Some other error
-					print("Some other database error")
-					traceback.print_exc()
-					raise
+	def executemany(self, tname, cmd, sql, rows):
+		"""
+		Execute the SQL statement once for each entry in @rows, an iterable of iterable containers of python values
+		corresponding to ? parameter values in the SQL statement.
+		The statement is prepared once and re-bound for each row.
+		"""
+
+		if _log.isEnabledFor(logging.DEBUG):
+			_log.debug("SH: SQL: %s (many)", sql)
+
+		return self._execute(tname, cmd, sql, rows, many=True)
+
+	def _execute(self, tname, cmd, sql, vals, many=False):
+		if self.DB is None:
+			_log.info("Reopen database")
+			self.reopen()
+
+		# A locked database (probably from another process) is waited on by sqlite per busy_timeout
+		try:
+			# Statements whose cursor is iterated by the caller (select) get their own cursor so that
+			# statements executed while iterating don't reset it. Everything else reuses the thread's cursor
+			# (or the connection itself if shared by threads, see _connect())
+			if cmd in ('insert', 'update', 'delete'):
+				cur = self._state.cursor
+			elif cmd == 'select' and self._read_pool is not None and not self._state.in_txn:
+				# Reads outside of a transaction are spread over the read-only connections
+				# (in a transaction they must see its uncommitted changes)
+				return self._execute_reader(sql, vals)
+			else:
+				cur = self.DB
+
+			if cmd in ('insert', 'update', 'delete') and self._write_lock is not None:
+				# One writer at a time on the connection shared by threads
+				with self._write_lock:
+					if many:
+						return cur.executemany(sql, vals)
+					else:
+						return cur.execute(sql, vals)
+
+			if many:
+				return cur.executemany(sql, vals)
+			else:
+				return cur.execute(sql, vals)
+		except sqlite3.OperationalError:
+			print("Database error")
+			traceback.print_exc()
+			raise
+
+	def _run(self, tname, cmd, sql, vals):
+		"""
+		Same as execute() for the statements built by this class, but once connected goes straight to the connection
+		rather than through execute() and _execute(). Insert/update/delete use the same thread safe _ConnState.cursor as
+		_execute() (the thread's own cursor, or the connection itself when shared by threads).
+		Connecting, reopening, and reads from the read-only connections are left to execute().
+		"""
+
+		st = self._state
+		if st.db is None or st.gen != self._gen or (cmd == 'select' and self._read_pool is not None and not st.in_txn):
+			return self.execute(tname, cmd, sql, vals)
+
+		if vals is None:
+			vals = tuple()
+
+		if _log.isEnabledFor(logging.DEBUG):
+			_log.debug("SH: SQL: %s %s", sql, vals)
+
+		try:
+			if cmd == 'select':
+				return st.db.execute(sql, vals)
+			elif self._write_lock is not None:
+				# One writer at a time on the connection shared by threads
+				with self._write_lock:
+					return st.cursor.execute(sql, vals)
+			else:
+				# Never a cursor used by other threads, see _connect()
+				return st.cursor.execute(sql, vals)
+		except sqlite3.OperationalError:
+			print("Database error")
+			traceback.print_exc()
+			raise
 
 	def select(self, tname, cols, where=None, vals=None, order=None):
 		"""
@@ -547,29 +1210,49 @@ class SH:
 			vals = []
 
 		# Select all
-		if cols is None or cols == '*':
+		if cols is None or cols == '*' or cols == '':
 			cols = '*'
+		elif isinstance(cols, str):
+			cols = (cols,)
 		else:
-			if type(cols) == str:
-				cols = [cols]
-			elif type(cols) == list:
-				if not all([type(_) is str for _ in cols]):
+			if self._validate:
+				if not isinstance(cols, (list, tuple)):
+					raise Exception("Unrecognized columns input")
+				if not all(isinstance(_, str) for _ in cols):
 					raise Exception("All columns are are expected to be a list of stirngs")
-			else:
-				raise Exception("Unrecognized columns input")
+			cols = tuple(cols)
 
-			# Comma separate list of names
-			cols = ','.join( ["`%s`"%_ for _ in cols] )
+		sql = _sql_for_select(tname, cols, where, order)
 
-		# Start formatting of sql string
-		sql = "SELECT %s FROM `%s`" % (cols, tname)
+		return self._run(tname, 'select', sql, vals)
+
+	def select_iter(self, tname, cols, where=None, vals=None, order=None, raw=False):
+		"""
+		Identical to select() except an iterator over the rows is returned.
+		Preferred for large result sets as rows are stepped one at a time rather than materialized with fetchall().
 
-		if where:
-			sql += " WHERE %s" % where
-		if order:
-			sql += " ORDER BY %s" % order
+		@raw returns each row as a plain tuple (in the order of @cols) instead of using the row factory (eg, sqlite3.Row),
+		which saves creating a row object per row on big result sets.
+		"""
+
+		res = self.select(tname, cols, where, vals, order)
+
+		# Row factory is applied as rows are fetched, so this covers every row
+		if raw:
+			res.row_factory = None
+
+		# Batch size for fetchmany()
+		res.arraysize = 256
+
+		return iter(res)
+
+	def select_scalars(self, tname, col, where=None, vals=None, order=None):
+		"""
+		Identical to select_iter() for the single column @col except the values themselves are returned rather than rows.
+		For example, select_scalars('employee', 'name') iterates over the names as strings.
+		"""
 
-		return self.execute(tname, 'select', sql, vals)
+		return (_[0] for _ in self.select_iter(tname, col, where, vals, order, raw=True))
 
 	def select_one(self, tname, cols, where, vals=None, order=None):
 		"""
@@ -594,24 +1277,35 @@ class SH:
 		if not self.InTransaction():
 			raise Exception("Attempting to insert not in a transaction")
 
-		names = []
-		vals = []
+		sql = _sql_for_insert(tname, tuple(cols))
 
-		for k,v in cols.items():
-			names.append(k)
-			vals.append(v)
+		res = self._run(tname, 'insert', sql, tuple(cols.values()))
 
-		vnames = ','.join( ['?']*len(names) )
+		return res.lastrowid
 
-		# Format column names
-		cols = ",".join( ["`%s`" % _ for _ in names] )
+	def insert_many(self, tname, colnames, rows):
+		"""
+		INSERT statement to add many rows of new information with one prepared statement.
 
-		# Format SQL
-		sql = "INSERT INTO `%s` (%s) VALUES (%s)" % (tname,cols,vnames)
+		@tname is a string representing the table name to select from
+		@colnames is a list of column names
+		@rows is an iterable of tuples of values, each aligned with @colnames
 
-		res = self.execute(tname, 'insert', sql, vals)
+		Like insert(), this requires a transaction and all rows are inserted within it, so wrap it in a single begin()/commit() (or txn()):
+			with db.txn():
+				db.insert_many('employee', ['name', 'awesome'], [('Ethyl', True), ('Bob', False)])
 
-		return res.lastrowid
+		All values are ultimately passed in using ? style parameters.
+		SQLite's limit on the number of parameters (999, or 32766 as of 3.32) applies per statement and not across
+		the rows passed to executemany(), so @rows does not need to be chunked.
+		"""
+
+		if not self.InTransaction():
+			raise Exception("Attempting to insert not in a transaction")
+
+		sql = _sql_for_insert(tname, tuple(colnames))
+
+		return self.executemany(tname, 'insert', sql, rows)
 
 	def update(self, tname, where, vals, joiner='AND'):
 		"""
@@ -629,64 +1323,103 @@ class SH:
 		if not self.InTransaction():
 			raise Exception("Attempting to update not in a transaction")
 
-		s_cols = []
-		s_vals = []
+		# SET clause, then WHERE clause
+		sql = _sql_for_update(tname, tuple(vals), tuple(where), joiner)
+
+		return self._run(tname, 'update', sql, (*vals.values(), *where.values()))
+
+	def delete(self, tname, where, joiner='AND'):
+		"""
+		DELETE statement to remove information
+
+		@tname is a string representing the table name to select from
+		@where is a dictionary of column name/value pairs to limit which rows are updated (ie, the WHERE clause)
+			{"rowid": 10, 'name': 'John'} -> "`rowid`=? AND `name`=?" and [10,'John'] are passed as values to execute()
+		"""
 
-		w_cols = []
-		w_vals = []
+		if not self.InTransaction():
+			raise Exception("Attempting to delete not in a transaction")
 
-		# SET clause
-		for k,v in vals.items():
-			s_cols.append('`%s`=?' % k)
-			s_vals.append(v)
+		sql = _sql_for_delete(tname, tuple(where), joiner)
 
-		# WHERE clause
-		for k,v in where.items():
-			w_cols.append('`%s`=?' % k)
-			w_vals.append(v)
+		return self._run(tname, 'delete', sql, tuple(where.values()))
 
-		if joiner.strip().lower() == 'and':
-			w = " AND ".join(w_cols)
-		elif joiner.strip().lower() == 'or':
-			w = " OR ".join(w_cols)
-		else:
-			raise ValueError("joiner parameter must be AND or OR")
+	def update_expr(self, tname, set_clause, where=None, vals=None):
+		"""
+		UPDATE statement with the SET clause given as SQL so that it can refer to the existing values.
+		Updates all matching rows in one statement rather than selecting them and calling update() for each.
 
-		s = ",".join(s_cols)
+		@tname is a string representing the table name to select from
+		@set_clause is a string essentially a SQL set clause (eg, "`visits`=`visits`+1", "`name`=?")
+		@where is a string essentially a SQL where clause (eg, "`country`=?")
+		@vals is an iterable container of python values to be substituted into ? parameters in @set_clause then @where
+		"""
 
-		sql = "UPDATE `%s` SET %s WHERE %s" % (tname, s, w)
+		if not self.InTransaction():
+			raise Exception("Attempting to update not in a transaction")
 
-		return self.execute(tname, 'update', sql, s_vals + w_vals)
+		if vals is None:
+			vals = tuple()
 
-	def delete(self, tname, where, joiner='AND'):
+		sql = _sql_for_update_expr(tname, set_clause, where)
+
+		return self._run(tname, 'update', sql, vals)
+
+	def update_in(self, tname, col, values, vals):
 		"""
-		DELETE statement to remove information
+		UPDATE statement to alter information in all rows where column @col is any of @values.
 
 		@tname is a string representing the table name to select from
-		@where is a dictionary of column name/value pairs to limit which rows are updated (ie, the WHERE clause)
-			{"rowid": 10, 'name': 'John'} -> "`rowid`=? AND `name`=?" and [10,'John'] are passed as values to execute()
+		@col is the column name to match against (eg, "rowid")
+		@values is an iterable of values of @col to update
+		@vals is a dictionary of column name/value pairs to update matched rows to (ie, the SET clause)
+
+		A single statement is executed per chunk of values rather than a statement per row.
+		Returns the number of rows updated.
 		"""
 
 		if not self.InTransaction():
-			raise Exception("Attempting to delete not in a transaction")
+			raise Exception("Attempting to update not in a transaction")
 
-		w_cols = []
-		w_vals = []
+		values = list(values)
+		s_cols = tuple(vals)
+		s_vals = list(vals.values())
 
-		for k,v in where.items():
-			w_cols.append('`%s`=?' % k)
-			w_vals.append(v)
+		# SET parameters count towards the limit too
+		n = max(1, _MAX_IN_VARS - len(s_cols))
 
-		if joiner.strip().lower() == 'and':
-			w = " AND ".join(w_cols)
-		elif joiner.strip().lower() == 'or':
-			w = " OR ".join(w_cols)
-		else:
-			raise ValueError("joiner parameter must be AND or OR")
+		cnt = 0
+		for i in range(0, len(values), n):
+			chunk = values[i:i+n]
+			sql = _sql_for_update_in(tname, s_cols, col, len(chunk))
+			cnt += self._run(tname, 'update', sql, s_vals + chunk).rowcount
+
+		return cnt
+
+	def delete_in(self, tname, col, values):
+		"""
+		DELETE statement to remove all rows where column @col is any of @values.
+
+		@tname is a string representing the table name to select from
+		@col is the column name to match against (eg, "rowid")
+		@values is an iterable of values of @col to delete
+
+		A single statement is executed per chunk of values rather than a statement per row.
+		Returns the number of rows deleted.
+		"""
+
+		if not self.InTransaction():
+			raise Exception("Attempting to delete not in a transaction")
+
+		values = list(values)
 
-		sql = "DELETE FROM `%s` WHERE %s" % (tname, w)
+		cnt = 0
+		for i in range(0, len(values), _MAX_IN_VARS):
+			chunk = values[i:i+_MAX_IN_VARS]
+			sql = _sql_for_delete_in(tname, col, len(chunk))
+			cnt += self._run(tname, 'delete', sql, chunk).rowcount
 
-		return self.execute(tname, 'delete', sql, w_vals)
+		return cnt
 
 	def num_rows(self, tname, where=None, vals=None):
 		"""
@@ -694,21 +1427,36 @@ class SH:
 		If a where clause is provided, then use that to limit the rows.
 		"""
 
-		sql = "SELECT count(*) as `count` FROM `%s`" % tname
-
-		if where:
-			sql += " WHERE %s" % where
+		sql = _sql_for_num_rows(tname, where)
 
-		if vals is None:
-			res = self.execute(tname, 'select', sql)
-		else:
-			res = self.execute(tname, 'select', sql, vals)
+		res = self._run(tname, 'select', sql, vals)
 		return res.fetchone()['count']
 
+	def has_any(self, tname, where=None, vals=None):
+		"""
+		Checks if there are any rows, limited to those matching the where clause if provided.
+		Cheaper than num_rows() as sqlite stops at the first matching row rather than counting them all.
+		"""
+
+		sql = _sql_for_has_any(tname, where)
+
+		res = self._run(tname, 'select', sql, vals)
+		return res.fetchone() is not None
+
 	@contextlib.contextmanager
 	def transaction(self):
+		"""
+		Context manager that wraps the block in begin() and commit(), or rollback() if an exception is raised.
+		Grouping many statements into one transaction is much faster than one transaction per statement:
+			with db.txn():
+				for row in rows:
+					db.employee.insert(**row)
+		"""
+
+		# begin() is outside the try so that failing to begin (eg, already in a transaction) doesn't roll back
+		# a transaction this block doesn't own
+		self.begin()
 		try:
-			self.begin()
 			yield
 			self.commit()
 		except:
@@ -717,3 +1465,175 @@ class SH:
 			self.rollback()
 			raise
 
+	# Shorthand for transaction()
+	txn = transaction
+
+SH._reserved = frozenset(dir(SH))
+
+
+class _PoolReader:
+	"""
+	Read-only connection of SHPool as handed out by get_read().
+	Cursors made through it are closed at the end of the get_read() block as any unfinished statement would hold its
+	read snapshot, and the next borrower of the connection would see the same old data.
+	Otherwise behaves as the sqlite3.Connection it wraps.
+	"""
+
+	__slots__ = ('_conn', '_cursors')
+
+	def __init__(self, conn):
+		self._conn = conn
+		# Weak so that cursors dropped in the block (which resets their statement) aren't kept around
+		self._cursors = weakref.WeakSet()
+
+	def cursor(self, *args):
+		cur = self._conn.cursor(*args)
+		self._cursors.add(cur)
+		return cur
+
+	def execute(self, sql, parameters=()):
+		return self.cursor().execute(sql, parameters)
+
+	def executemany(self, sql, parameters):
+		return self.cursor().executemany(sql, parameters)
+
+	def _close_cursors(self):
+		for cur in list(self._cursors):
+			cur.close()
+		self._cursors.clear()
+
+	def __getattr__(self, name):
+		# Everything else is taken from the connection
+		return getattr(self._conn, name)
+
+class SHPool:
+	"""
+	Pool of read-only connections plus a single writer connection to one database file.
+	Use in WAL journal mode (the default PRAGMAs of SH) so that readers don't block the writer and can run concurrently.
+	Fetch results inside the get_read() block: its cursors are closed at the end of it so that the connection doesn't hold
+	on to an old snapshot of the database when handed out again.
+
+	@n is the number of reader connections, which defaults to the number of CPUs (at least 4)
+		Read-heavy workloads with many threads may benefit from larger pools (eg, 25-50).
+	@rowfactory, @pragmas, @native_types, and @cached_statements are as for SH.open() and SH()
+
+		pool = SHPool("foo.db")
+		with pool.get_read() as conn:
+			rows = conn.execute("SELECT * FROM `employee`").fetchall()
+		with pool.get_write() as conn:
+			conn.execute("INSERT INTO `employee` (`name`) VALUES (?)", ['Ethyl'])
+	"""
+
+	def __init__(self, fname, n=None, rowfactory=None, pragmas=None, native_types=False, cached_statements=256):
+		if fname == ':memory:':
+			raise ValueError("Cannot pool connections to an in-memory database, each connection would get its own database")
+
+		if n is None:
+			n = max(4, os.cpu_count() or 1)
+
+		self._fname = fname
+		self._rowfact = rowfactory or sqlite3.Row
+		self._cached_statements = cached_statements
+
+		if native_types:
+			self._detect = 0
+		else:
+			self._detect = sqlite3.PARSE_DECLTYPES
+
+		# Set by close(), which holds _lock so that no reader is returned to the pool while it's being emptied
+		self._closed = False
+		self._lock = threading.Lock()
+
+		# Writer is opened first as it creates the database file and sets the journal mode
+		self._write_lock = threading.Lock()
+		self._writer = self._connect(fname)
+		_apply_pragmas(self._writer, fname, SH.__pragmas__, pragmas)
+
+		uri = "file:%s?mode=ro" % urllib.parse.quote(os.path.abspath(fname))
+
+		self._readers = queue.Queue(n)
+		for i in range(n):
+			conn = self._connect(uri, uri=True)
+			# Journal mode is persistent and set by the writer (and cannot be changed from a read-only connection)
+			_apply_pragmas(conn, fname, SH.__pragmas__, pragmas, skip=('journal_mode',))
+			self._readers.put(conn)
+
+	def _connect(self, fname, uri=False):
+		conn = sqlite3.connect(fname, detect_types=self._detect, check_same_thread=False, isolation_level="DEFERRED", uri=uri, cached_statements=self._cached_statements)
+		conn.row_factory = self._rowfact
+		return conn
+
+	@property
+	def Filename(self): return self._fname
+
+	@contextlib.contextmanager
+	def get_read(self):
+		"""
+		Check out a read-only connection for the duration of the block.
+		Blocks until a connection is available.
+		Cursors made by execute() or cursor() in the block are closed at the end of it, so fetch all results needed in the block.
+		"""
+
+		if self._closed:
+			raise Exception("Pool is closed")
+
+		conn = self._readers.get()
+		if conn is None:
+			# close() was called while waiting, pass it on to any other waiting threads
+			self._readers.put(None)
+			raise Exception("Pool is closed")
+
+		reader = _PoolReader(conn)
+		try:
+			yield reader
+		finally:
+			# Ends unfinished statements (and their snapshots) before the connection is handed out again
+			reader._close_cursors()
+
+			with self._lock:
+				if self._closed:
+					conn.close()
+				else:
+					self._readers.put(conn)
+
+	@contextlib.contextmanager
+	def get_write(self):
+		"""
+		Check out the writer connection for the duration of the block.
+		Writes are serialized, and the block is committed at the end or rolled back if an exception is raised.
+		"""
+
+		with self._write_lock:
+			if self._closed:
+				raise Exception("Pool is closed")
+
+			try:
+				yield self._writer
+				self._writer.commit()
+			except:
+				self._writer.rollback()
+				raise
+
+	def close(self):
+		"""
+		Closes all connections.
+		Any reader connections checked out at the time are closed when returned to the pool.
+		get_read() and get_write() raise an exception afterwards.
+		"""
+
+		with self._lock:
+			if self._closed:
+				return
+			self._closed = True
+
+			while True:
+				try:
+					self._readers.get_nowait().close()
+				except queue.Empty:
+					break
+
+			# Wakes up threads waiting in get_read()
+			self._readers.put(None)
+
+		with self._write_lock:
+			self._writer.close()
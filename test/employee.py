@@ -34,32 +34,36 @@ if __name__ == '__main__':
 	db = mydb("foo.db")
 	db.open()
 
-	db.employee.insert(name='Ethyl', DOB=datetime.datetime.utcnow(), awesome=True)
-	db.employee.insert(name='Bob', DOB=datetime.datetime.utcnow(), awesome=True)
-	db.employee.insert(name='John', DOB=datetime.datetime.utcnow(), awesome=False)
+	# Changes must be made in a transaction, and all of them are committed together at the end of the block
+	with db.transaction():
+		db.employee.insert(name='Ethyl', DOB=datetime.datetime.utcnow(), awesome=True)
+		db.employee.insert(name='Bob', DOB=datetime.datetime.utcnow(), awesome=True)
+		db.employee.insert(name='John', DOB=datetime.datetime.utcnow(), awesome=False)
 
-	print("Current employees: %s" % (",".join( sorted([_['name'] for _ in db.employee.select("name")]) )))
+	print("Current employees: %s" % (",".join( sorted(db.employee.select_scalars("name")) )))
 
 	for e in db.employee.select('name', '`awesome`=?', [True]):
 		print("Awesome employee: %s" % e['name'])
-	for e in db.employee.select(['rowid','name'], '`awesome`=?', [False]):
-		print("Decidedly NOT awesome employee: %s" % e['name'])
-		# Get rid of that employee
-		db.employee.delete({'rowid': e['rowid']})
+	with db.transaction():
+		for e in db.employee.select(['rowid','name'], '`awesome`=?', [False]):
+			print("Decidedly NOT awesome employee: %s" % e['name'])
+			# Get rid of that employee
+			db.employee.delete({'rowid': e['rowid']})
 
-	print("Current employees: %s" % (",".join( sorted([_['name'] for _ in db.employee.select("name")]) )))
+	print("Current employees: %s" % (",".join( sorted(db.employee.select_scalars("name")) )))
 
 	print("----------------")
 
-	db.address.insert(street='1600 Pennsylvania Ave', city='Washington', state='DC', country='USA', visits=5)
-	db.address.insert(street='10 Downing Street', city='London', country='England', visits=0)
+	with db.transaction():
+		db.address.insert(street='1600 Pennsylvania Ave', city='Washington', state='DC', country='USA', visits=5)
+		db.address.insert(street='10 Downing Street', city='London', country='England', visits=0)
 
 	for a in db.address.select("*"):
 		print("Address I want to visit: %s, %s, %s; been there %d times" % (a['street'], a['city'], a['country'], a['visits']))
 
 	print("Go visit all of Europe")
-	for a in db.address.select(["rowid","visits"], "`country`=?", ['England']):
-		db.address.update({"rowid": a['rowid']}, {"visits": a['visits']+1})
+	with db.transaction():
+		db.address.update_expr("`visits`=`visits`+1", "`country`=?", ['England'])
 
 	for a in db.address.select("*"):
 		print("Address I want to visit: %s, %s, %s; been there %d times" % (a['street'], a['city'], a['country'], a['visits']))
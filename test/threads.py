@@ -0,0 +1,184 @@
+"""Checks of the reader connections and threads (see README "Threads"), run as a script"""
+
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import threading
+from sqlitehelper import SH,SHPool,DBTable,DBCol
+
+class mydb(SH):
+	__schema__ = [
+		DBTable('e',
+			DBCol('v', 'integer')
+		)
+	]
+
+def opendb(d, name, **kwargs):
+	db = mydb(os.path.join(d, name), **kwargs)
+	db.open()
+	db.MakeDatabaseSchema()
+	return db
+
+def check_fetch(db):
+	"""Reader cursors behave as sqlite3 cursors when fetching past the end."""
+
+	with db.transaction():
+		db.e.insert_many(['v'], [(i,) for i in range(250)])
+
+	cur = db.e.select('*')
+	sizes = []
+	while True:
+		rows = cur.fetchmany(100)
+		if not rows:
+			break
+		sizes.append(len(rows))
+	assert sizes == [100, 100, 50], sizes
+	assert cur.fetchmany(100) == []
+
+	cur = db.e.select('*', '`v`=?', [1])
+	assert cur.fetchone()['v'] == 1
+	assert cur.fetchone() is None
+	assert cur.fetchone() is None
+
+	cur = db.e.select('*', '`v`<?', [3])
+	assert len(list(cur)) == 3
+	assert cur.fetchall() == []
+
+	assert sum(db.e.select_scalars('v')) == sum(range(250))
+
+	# Every reader is back in the pool once results are exhausted or dropped
+	it = db.e.select_iter('*')
+	next(it)
+	del it
+	assert db._read_pool.qsize() == db._readers
+
+def check_snapshot(db):
+	"""Selects see committed changes even while another select is unfinished."""
+
+	n = db.e.num_rows()
+	it = db.e.select_iter('*')
+	next(it)
+
+	with db.transaction():
+		db.e.insert(v=-1)
+
+	assert [db.e.num_rows() for _ in range(4)] == [n+1]*4
+	del it
+
+	# More unfinished selects than readers don't wait for a reader
+	cnt = 0
+	for a in db.e.select_iter('*', '`v`<?', [3]):
+		for b in db.e.select_iter('*', '`v`<?', [3]):
+			for c in db.e.select_iter('*', '`v`<?', [3]):
+				cnt += 1
+	assert cnt == 4*4*4, cnt
+
+def check_threads(db, nthreads=4, n=2000):
+	"""Threads writing in one transaction on the shared connection, while others read."""
+
+	before = db.e.num_rows()
+	errors = []
+
+	def writer():
+		try:
+			for i in range(n):
+				db.e.insert(v=i)
+		except Exception as e:
+			errors.append(e)
+
+	def reader():
+		try:
+			for i in range(100):
+				assert db.e.num_rows() >= before
+				assert len(list(db.e.select_iter('*'))) >= before
+		except Exception as e:
+			errors.append(e)
+
+	ts = [threading.Thread(target=writer) for _ in range(nthreads)]
+	ts += [threading.Thread(target=reader) for _ in range(nthreads)]
+
+	db.begin()
+	for t in ts:
+		t.start()
+	for t in ts:
+		t.join()
+	db.commit()
+
+	assert not errors, errors
+	assert db.e.num_rows() == before + nthreads*n
+
+def check_thread_local(db, nthreads=4):
+	"""Each thread's connection is closed when the thread finishes, including those replaced by reopen()."""
+
+	conns = []
+
+	def worker():
+		with db.transaction():
+			db.e.insert(v=1)
+		conns.append(db.DB)
+		db.reopen()
+		conns.append(db.DB)
+
+	before = db.e.num_rows()
+	ts = [threading.Thread(target=worker) for _ in range(nthreads)]
+	for t in ts:
+		t.start()
+	for t in ts:
+		t.join()
+
+	# ts still references the threads, the connections must be closed regardless
+	for conn in conns:
+		try:
+			conn.execute("SELECT 1")
+		except sqlite3.ProgrammingError:
+			pass
+		else:
+			raise AssertionError("Connection of a finished thread is still open")
+	assert db._conns == {db.DB}, db._conns
+	assert db.e.num_rows() == before + nthreads
+
+def check_pool(fname):
+	"""SHPool readers see committed changes even if a block left a select unfinished."""
+
+	pool = SHPool(fname, 1)
+	with pool.get_write() as conn:
+		conn.execute("CREATE TABLE `t` (`x` integer)")
+		conn.executemany("INSERT INTO `t` (`x`) VALUES (?)", [(i,) for i in range(10)])
+
+	with pool.get_read() as conn:
+		cur = conn.execute("SELECT `x` FROM `t`")
+		cur.fetchone()
+
+	with pool.get_write() as conn:
+		conn.execute("INSERT INTO `t` (`x`) VALUES (?)", [10])
+
+	with pool.get_read() as conn:
+		assert conn.execute("SELECT count(*) FROM `t`").fetchone()[0] == 11
+
+	pool.close()
+
+if __name__ == '__main__':
+	d = tempfile.mkdtemp()
+	try:
+		db = opendb(d, 'readers.db', readers=2)
+		check_fetch(db)
+		check_snapshot(db)
+		check_threads(db)
+		db.close()
+		print("Readers: OK")
+
+		db = opendb(d, 'shared.db')
+		check_threads(db)
+		db.close()
+		print("Shared connection: OK")
+
+		db = opendb(d, 'local.db', thread_local=True)
+		check_thread_local(db)
+		db.close()
+		print("Thread local connections: OK")
+
+		check_pool(os.path.join(d, 'pool.db'))
+		print("SHPool: OK")
+	finally:
+		shutil.rmtree(d)